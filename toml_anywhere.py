@@ -16,69 +16,103 @@ and can be used to wrap any command line program.
 Pass "-" as the command to only print the arguments to stdout.
 """
 
+import os
 import sys
-import json
-import shlex
-import argparse
-import datetime
-import subprocess
-from pprint import pprint
 
-# Use tomllib if avaliable
-if sys.version_info >= (3, 11):
-    import tomllib
-else:
-    import tomli as tomllib
+# Modules only needed once a config is loaded or printed
+# are imported where they are used, to keep startup fast.
 
 
-# JSON Serializer with support for datetime
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        # datetime.isoformat() spec is ISO 8601 compliant and RFC 3339 compliant
-        if isinstance(obj, (datetime.date, datetime.datetime)):
-            return obj.isoformat()
+def json_default(obj):
+    """
+    JSON serializer hook with support for datetime.
+    """
+    import datetime
 
-        return super().default(obj)
+    # datetime.isoformat() spec is ISO 8601 compliant and RFC 3339 compliant
+    if isinstance(obj, (datetime.date, datetime.datetime, datetime.time)):
+        return obj.isoformat()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 def generate_pairs(config):
-    for key, value in config.items():
-        key = key.replace('_', '-')
-
-        if isinstance(value, dict):
-            # key is actually a table, not a key value pair
-            # recursively parse args
-            for part_key, part_value in generate_pairs(value):
-                yield f"{key}.{part_key}", part_value
-        else:
-            # Restore TOML date format
-            # datetime.isoformat() spec is ISO 8601 compliant and RFC 3339 compliant
-            if isinstance(value, (datetime.date, datetime.datetime)):
+    from datetime import date, datetime, time
+
+    # TOML only produces these exact types, so match by identity
+    date_types = (datetime, date, time)
+
+    # Walk tables depth first with an explicit stack of
+    # (key prefix, table items) to keep the config order
+    stack = [("", iter(config.items()))]
+    while stack:
+        prefix, items = stack[-1]
+
+        for key, value in items:
+            key = prefix + key.replace('_', '-')
+
+            if isinstance(value, dict):
+                # key is actually a table, not a key value pair
+                # descend into table, then resume this one
+                stack.append((f"{key}.", iter(value.items())))
+                break
+
+            if isinstance(value, (str, bool)):
+                # Strings pass through, bools are handled as flags
+                pass
+            elif isinstance(value, int):
+                # Same as JSON, without the encoder
+                # Floats are never seen, as they are parsed as strings
+                value = str(value)
+            elif type(value) in date_types:
+                # Restore TOML date format
+                # datetime.isoformat() spec is ISO 8601 compliant and RFC 3339 compliant
                 value = value.isoformat()
-
-            # Format value as JSON if not string
-            # For lists and dictionaries
-            if not isinstance(value, (str, bool)):
-                value = json.dumps(value, cls = DateTimeEncoder)
+            else:
+                # Format value as JSON for lists
+                import json
+                value = json.dumps(value, default = json_default)
 
             yield key, value
+        else:
+            # Table exhausted
+            stack.pop()
 
 
-def config_to_args(config):
+def iter_config_args(config):
     """
-    Parse config and make a list of arguments from config file.
+    Parse config and yield arguments from config file one at a time.
     """
-    args = []
-
     for key, value in generate_pairs(config):
         # Add argument as flag is value is True, not a different type
         if isinstance(value, bool):
             if value:
-                args.extend([f"--{key}"])
+                yield f"--{key}"
         else:
-            args.extend([f"--{key}", f"{value}"])
+            # Other values are already strings from generate_pairs()
+            yield f"--{key}"
+            yield value
 
-    return args
+
+def config_to_args(config):
+    """
+    Parse config and make a list of arguments from config file.
+    """
+    return list(iter_config_args(config))
+
+
+def escape_arg(arg):
+    """
+    Escape whitespace and other unprintable characters in argument.
+    """
+    if (arg.isprintable() and "\\" not in arg
+        and not ("'" in arg and '"' in arg)):
+        # Nothing to escape, skip building repr
+        # repr escapes single quotes when both quote types are present
+        return arg
+
+    # Using repr to escape whitespace
+    return repr(arg)[1:-1]
 
 
 def args_to_cmd(args):
@@ -90,8 +124,9 @@ def args_to_cmd(args):
     For example a literal new line on the command line is printed as "\n",
     even though a shell likely would not expand this back to a literal newline.
     """
-    # Using repr to escape whitespace
-    return " ".join([shlex.quote(repr(x)[1:-1]) for x in args])
+    import shlex
+
+    return " ".join([shlex.quote(escape_arg(x)) for x in args])
 
 
 def split_args(args):
@@ -102,27 +137,35 @@ def split_args(args):
     The command is will be kept as the last internal argument.
     """
     # Find index of last internal arguement
+    # Single pass, using only locals in the loop
+    args_len = len(args)
+    get = args.__getitem__
     i = 0
-    while i < len(args):
-        if args[i] == "--flag":
+    while i < args_len:
+        a = get(i)
+        if a == "--flag":
             # Skip flag value
             i += 2
-        elif args[i] == "--":
+            continue
+
+        if a == "--":
             # Marker to stop argument parsing
             # Assume command is next
             i += 1
             break
-        elif args[i] == "-":
-            # Dryrun command
-            break
-        elif args[i].startswith("-"):
-            # Assume to be a flag argument, argparse will validate
-            i += 1
-        else:
-            # Non-flag encountered, assume to be command
+
+        if a == "-" or a[:1] != "-":
+            # Dryrun command, or non-flag assumed to be command
             # argparse will validate
             break
 
+        # Assume to be a flag argument, argparse will validate
+        i += 1
+
+    if i >= args_len:
+        # No command given, argparse will show help or report the error
+        return args, []
+
     # Split args
     internal_args, command, external_args = args[:i], args[i], args[i + 1:]
 
@@ -134,7 +177,190 @@ def split_args(args):
     return internal_args + [command], external_args
 
 
-def main(args = None):
+def get_tomllib():
+    """
+    Import TOML parser module.
+    """
+    # Use tomllib if avaliable
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+
+    return tomllib
+
+
+def parse_config_file(path):
+    """
+    Read and parse TOML config file.
+    """
+    # Read whole file at once, and parse from memory
+    with open(path, "rb") as f:
+        data = f.read()
+
+    return get_tomllib().loads(data.decode("utf-8"), parse_float = str)
+
+
+# Parsed configs by (absolute path, modification time),
+# so a config given more than once is only parsed once
+CONFIG_CACHE = {}
+
+
+def load_config(config):
+    """
+    Load TOML config file.
+
+    Exits if the file can not be read or parsed.
+    """
+    tomllib = get_tomllib()
+
+    try:
+        key = (os.path.abspath(config), os.stat(config).st_mtime_ns)
+        if key not in CONFIG_CACHE:
+            # Open path as given, so errors name it as the user typed it
+            CONFIG_CACHE[key] = parse_config_file(config)
+
+        return CONFIG_CACHE[key]
+    except IOError as exc:
+        sys.stderr.write(f"Failed to parse config: {exc}\n")
+    except (UnicodeDecodeError, tomllib.TOMLDecodeError) as exc:
+        sys.stderr.write(f"Failed to parse config: {exc}: {config!r}\n")
+
+    sys.exit(2)
+
+
+def print_cmd(args, out = None):
+    """
+    Print arguments formatted as a shell command.
+
+    Same format as args_to_cmd(), but written one argument at a time
+    rather than building the whole command string.
+    """
+    import shlex
+
+    if out is None:
+        out = sys.stdout
+
+    it = iter(args)
+    first = next(it, None)
+    if first is not None:
+        out.write(shlex.quote(escape_arg(first)))
+
+        for a in it:
+            out.write(" ")
+            out.write(shlex.quote(escape_arg(a)))
+
+    out.write("\n")
+
+
+def print_pretty(args):
+    """
+    Pretty print arguments list.
+    """
+    from pprint import pprint
+    pprint(args)
+
+
+def print_list(args):
+    """
+    Print arguments as a Python list.
+    """
+    sys.stdout.write(repr(args) + "\n")
+
+
+# Default command line flag replaced with config arguments
+DEFAULT_FLAG = "--config"
+DEFAULT_FLAG_EQ = DEFAULT_FLAG + "="
+
+# Print modes, used as index into PRINTERS
+PRINT_NONE, PRINT_CMD, PRINT_PRETTY, PRINT_LIST = range(4)
+PRINTERS = (None, print_cmd, print_pretty, print_list)
+
+
+class InternalArgs:
+    """
+    Internal arguments, with the same attributes as parsed by argparse.
+    """
+    def __init__(self):
+        self.print_mode = PRINT_NONE
+        self.dryrun = False
+        self.flag = DEFAULT_FLAG
+        self.command = None
+
+
+# Map of internal flags to the InternalArgs attribute and value they set
+INTERNAL_FLAGS = {
+    "-p": ("print_mode", PRINT_CMD),
+    "--print": ("print_mode", PRINT_CMD),
+    "--pprint": ("print_mode", PRINT_PRETTY),
+    "--pretty-print": ("print_mode", PRINT_PRETTY),
+    "-l": ("print_mode", PRINT_LIST),
+    "--list": ("print_mode", PRINT_LIST),
+    "-d": ("dryrun", True),
+    "--dryrun": ("dryrun", True),
+}
+
+
+def parse_internal_args(args):
+    """
+    Parse internal arguments without argparse.
+
+    Only handles the plain spelling of each flag. Returns None for anything
+    else (help, version, abbreviated or combined flags, and errors), which
+    should be handed to the full argparse parser from build_parser().
+    """
+    internal_args = InternalArgs()
+    positionals = []
+
+    args_len = len(args)
+    i = 0
+    while i < args_len:
+        a = args[i]
+        if a in INTERNAL_FLAGS:
+            attr, value = INTERNAL_FLAGS[a]
+            if (attr == "print_mode"
+                and internal_args.print_mode not in (PRINT_NONE, value)):
+                # Print modes are mutually exclusive
+                return None
+
+            setattr(internal_args, attr, value)
+        elif a == "--flag":
+            if i + 1 >= args_len or args[i + 1][:1] == "-":
+                # Missing value, let argparse decide
+                return None
+
+            internal_args.flag = args[i + 1]
+            i += 1
+        elif a.startswith("--flag="):
+            internal_args.flag = a[len("--flag="):]
+        elif a == "--":
+            # Everything after is positional
+            positionals.extend(args[i + 1:])
+            break
+        elif a == "-" or a[:1] != "-":
+            positionals.append(a)
+        else:
+            # Unknown flag
+            return None
+
+        i += 1
+
+    if len(positionals) != 1:
+        return None
+
+    internal_args.command = positionals[0]
+    return internal_args
+
+
+def build_parser():
+    """
+    Build argparse parser for internal arguments.
+
+    Only needed for help, version, and error reporting,
+    see parse_internal_args() for the common path.
+    """
+    import argparse
+
     parser = argparse.ArgumentParser(
         description = "Load command line arguments from TOML configuration for any program.",
         add_help = False)
@@ -146,95 +372,121 @@ def main(args = None):
 
     print_group = parser.add_mutually_exclusive_group()
     # Can only specify one print out type at a time
-    print_group.add_argument("-p", "--print", action = "store_true",
+    print_group.add_argument("-p", "--print", action = "store_const",
+        dest = "print_mode", const = PRINT_CMD, default = PRINT_NONE,
         help = "Print command line arguments before command is called. "
                "Specify only one of --print, --pretty-print, --list.")
-    print_group.add_argument("--pprint", "--pretty-print", action = "store_true",
-        dest = "pretty_print",
+    print_group.add_argument("--pprint", "--pretty-print", action = "store_const",
+        dest = "print_mode", const = PRINT_PRETTY, default = PRINT_NONE,
         help = "Pretty print command line arguments immediatly before command is called. "
                "Specify only one of --print, --pretty-print, --list.")
-    print_group.add_argument("-l", "--list", action = "store_true",
+    print_group.add_argument("-l", "--list", action = "store_const",
+        dest = "print_mode", const = PRINT_LIST, default = PRINT_NONE,
         help = "Print command line arguments as a list before command is called. "
                "Specify only one of --print, --pretty-print, --list.")
 
     parser.add_argument("-d", "--dryrun", action = "store_true",
         help = "Show command, but do not run it. Affected by print mode flags. "
                "Implied by setting command to '-'.")
-    parser.add_argument("--flag", default = "--config",
-        help = "Command line flag replace for command arguments. Default is '--config'.")
+    parser.add_argument("--flag", default = DEFAULT_FLAG,
+        help = f"Command line flag replace for command arguments. Default is {DEFAULT_FLAG!r}.")
     parser.add_argument('command',
         help = "Path to executable to call. '-' causes the commands to just be printed.")
 
+    return parser
+
+
+def run_command(command_args):
+    """
+    Replace this process with the command.
+
+    Does not return, exits on failure.
+    """
+    # Nothing left to do after the command, so replace this process
+    # with it. Flush first, as exec discards buffered output.
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        os.execvp(command_args[0], command_args)
+    except (OSError, ValueError) as exc:
+        # Suppress stack trace, as caused by external program execution
+        # ValueError is raised for an empty command
+        sys.stderr.write(f"{type(exc).__name__}: {exc}: {command_args[0]!r}\n")
+        sys.exit(1)
+
+
+def main(args = None):
     if not args:
         args = sys.argv[1:]
 
     if not args:
         # Just show help
+        parser = build_parser()
         parser.print_help()
         parser.exit()
 
+    if (args[0][:1] != "-"
+        and not any(a == DEFAULT_FLAG or a.startswith(DEFAULT_FLAG_EQ) for a in args)):
+        # No internal arguments and no config, so nothing to translate
+        # Run command as is, skipping argument parsing entirely
+        run_command(args)
+
     internal_args, external_args = split_args(args)
 
-    # Parse internal arguments (and exit on failure)
-    internal_args = parser.parse_args(internal_args)
+    # Parse internal arguments
+    parsed_args = parse_internal_args(internal_args)
+    if parsed_args is None:
+        # Fall back to argparse (and exit on failure)
+        parsed_args = build_parser().parse_args(internal_args)
+
+    internal_args = parsed_args
 
     # Command of "-" or dryrun implies print
     if internal_args.command == "-":
         internal_args.dryrun = True
 
-    if (internal_args.dryrun
-        and not internal_args.list and
-        not internal_args.print
-        and not internal_args.pretty_print):
+    if internal_args.dryrun and not internal_args.print_mode:
         # Default to printing
-        internal_args.print = True
+        internal_args.print_mode = PRINT_CMD
 
     # Build new command args list from given args
     command_args = []
 
+    # Config flag, and prefix for when value is embedded in argument
+    flag = internal_args.flag
+    flag_eq = flag + "="
+    flag_eq_len = len(flag_eq)
+
     # Combine config results into argument list
+    external_len = len(external_args)
     i = 0
-    while i < len(external_args):
-        if external_args[i] == internal_args.flag:
-            if i + 1 >= len(external_args):
+    while i < external_len:
+        a = external_args[i]
+        if a == flag:
+            if i + 1 >= external_len:
                 # No given value
-                parser.error("--config: Expected one argument")
+                build_parser().error("--config: Expected one argument")
 
             # Next argument is config file
             config = external_args[i + 1]
 
             if config.startswith("-"):
                 # Is a flag, not a config file
-                parser.error("--config: Expected one argument")
-
-            try:
-                with open(config, "rb") as f:
-                    config_data = tomllib.load(f, parse_float = str)
-            except IOError as exc:
-                parser.exit(2, f"Failed to parse config: {exc}\n")
-            except tomllib.TOMLDecodeError as exc:
-                parser.exit(2, f"Failed to parse config: {exc}: {config!r}\n")
+                build_parser().error("--config: Expected one argument")
 
-            command_args.extend(config_to_args(config_data))
+            command_args.extend(iter_config_args(load_config(config)))
             i += 1
 
-        elif external_args[i].startswith(internal_args.flag + "="):
+        elif a.startswith(flag_eq):
             # Config file is embedded in argument
-            config = external_args[i][len(internal_args.flag + "="):]
-
-            try:
-                with open(config, "rb") as f:
-                    config_data = tomllib.load(f, parse_float = str)
-            except IOError as exc:
-                parser.exit(2, f"Failed to parse config: {exc}\n")
-            except tomllib.TOMLDecodeError as exc:
-                parser.exit(2, f"Failed to parse config: {exc}: {config!r}\n")
+            config = a[flag_eq_len:]
 
-            command_args.extend(config_to_args(config))
+            command_args.extend(iter_config_args(load_config(config)))
 
         else:
             # Argument is not config
-            command_args.append(external_args[i])
+            command_args.append(a)
 
         i += 1
 
@@ -243,25 +495,12 @@ def main(args = None):
         # Prepend command
         command_args.insert(0, internal_args.command)
 
-    if internal_args.list:
-        # Just print list
-        print(command_args)
-    elif internal_args.print:
-        # Format args for printing
-        print(args_to_cmd(command_args))
-    elif internal_args.pretty_print:
-        # Pretty Print
-        pprint(command_args)
-    elif internal_args.print:
-        print('\n'.join(command_args))
+    if internal_args.print_mode:
+        PRINTERS[internal_args.print_mode](command_args)
 
     # Run it
     if not internal_args.dryrun:
-        try:
-            subprocess.run(command_args)
-        except IOError as exc:
-            # Suppress stack trace, as caused by external program execution
-            parser.exit(1, f"{type(exc).__name__}: {exc}\n")
+        run_command(command_args)
 
 
 if __name__ == "__main__":